@@ -2,16 +2,24 @@ from flask import Flask, render_template, request, jsonify, send_from_directory
 import os, json
 from models.vsm_analyzer import VSMAnalyzer
 from models.chatbot_engine import VSMChatbot
+from models.inference_service import InferenceClient
+from models.analytics_store import AnalyticsStore
 from datetime import datetime
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
-OUTPUT_FOLDER = "vsm_output"
+OUTPUT_FOLDER = os.environ.get("VSM_OUTPUT_FOLDER", "vsm_output")
+DB_PATH = os.environ.get("VSM_DB_PATH", "vsm_data.db")
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 # Instances
-analyzer = VSMAnalyzer(enable_ai=True)
-chatbot = VSMChatbot()  # ← NOUVEAU CHATBOT INTELLIGENT
+# Service d'inférence partagé (optionnel): python -m models.inference_service
+# prédiction locale si le service ne répond pas
+INFERENCE_SOCKET = os.environ.get("VSM_INFERENCE_SOCKET")
+analyzer = VSMAnalyzer(enable_ai=True, ml=InferenceClient(INFERENCE_SOCKET, local_fallback=True) if INFERENCE_SOCKET else None)
+# Agrégats du chatbot sur l'export Parquet (optionnel): python -m models.analytics_store export
+ANALYTICS_STORE = os.environ.get("VSM_ANALYTICS_STORE")
+chatbot = VSMChatbot(DB_PATH, analytics_store=AnalyticsStore(ANALYTICS_STORE) if ANALYTICS_STORE else None)  # ← NOUVEAU CHATBOT INTELLIGENT
 
 @app.route("/")
 def index():
@@ -84,15 +84,22 @@ class MLAnalyzer:
 
     def predict_wait_time(self, step):
         """Prédire le temps d'attente pour une étape"""
+        return self.predict_wait_times([step])[0]
+
+    def predict_wait_times(self, steps):
+        """Prédire les temps d'attente de plusieurs étapes en un seul appel au modèle"""
         if not self.pipeline:
             self.train()
+
+        if not steps:
+            return []
+
         X = pd.DataFrame([{
-            "cycle_time": step.get("cycle_time", 0),
-            "cost": step.get("cost", 0),
-            "value_added": 1 if step.get("value_added") else 0
-        }])
-        pred = float(self.pipeline.predict(X)[0])
-        return round(pred, 2)
+            "cycle_time": s.get("cycle_time", 0),
+            "cost": s.get("cost", 0),
+            "value_added": 1 if s.get("value_added") else 0
+        } for s in steps])
+        return [round(float(p), 2) for p in self.pipeline.predict(X)]
 
     def predict_critical_flags(self, steps):
         """Prédire si les étapes sont critiques (goulots d'étranglement)"""
@@ -0,0 +1,414 @@
+# models/analytics_store.py
+"""
+Export colonne (Parquet) de l'historique des analyses pour les tableaux de bord.
+
+- AnalyticsExporter copie de façon incrémentale les tables `analyses` et `step_history`
+  de vsm_data.db ainsi que les timelines des fichiers JSON de vsm_output/ vers des
+  fichiers Parquet partitionnés par mois et par processus (month=YYYY-MM/process=...).
+  Un watermark (_watermark.json) mémorise le dernier id / fichier exporté: chaque
+  exécution n'écrit que les nouvelles lignes. Les partitions modifiées qui dépassent
+  max_files_per_partition fichiers sont fusionnées en un seul fichier.
+- AnalyticsStore lit ce stockage (pyarrow.dataset) pour les agrégats du chatbot et
+  des outils de benchmark sans interroger SQLite.
+
+    python -m models.analytics_store export
+    python -m models.analytics_store compact
+    python -m models.analytics_store summary
+
+Nécessite pyarrow.
+"""
+from typing import Dict, List, Any, Optional
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+DEFAULT_STORE_PATH = "vsm_analytics"
+WATERMARK_FILE = "_watermark.json"
+DEFAULT_PROCESS = "Processus non défini"
+# files written by app.py; lexical order is chronological order
+OUTPUT_NAME = re.compile(r"^vsm_\d{8}_\d{6}\.json$")
+# columns identifying a record, to drop duplicates left by an interrupted compaction
+ROW_KEYS = {
+    "analyses": ("id",),
+    "step_history": ("id",),
+    "output_steps": ("file", "step_name", "start")
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("L'export analytique nécessite pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    """Schémas fixes: les fichiers de toutes les exécutions restent compatibles"""
+    return {
+        "analyses": pa.schema([
+            ("id", pa.int64()), ("lead_time", pa.float64()), ("va_ratio", pa.float64()),
+            ("total_cost", pa.float64()), ("nb_steps", pa.int64()), ("bottleneck_step", pa.string()),
+            ("alert_count", pa.int64()), ("timestamp", pa.timestamp("s"))
+        ]),
+        "step_history": pa.schema([
+            ("id", pa.int64()), ("analysis_id", pa.int64()), ("step_name", pa.string()),
+            ("cycle_time", pa.float64()), ("wait_time", pa.float64()), ("cost", pa.float64()),
+            ("value_added", pa.bool_()), ("timestamp", pa.timestamp("s"))
+        ]),
+        "output_steps": pa.schema([
+            ("file", pa.string()), ("lead_time", pa.float64()), ("va_ratio", pa.float64()),
+            ("step_name", pa.string()), ("start", pa.float64()), ("end", pa.float64()),
+            ("wait", pa.float64()), ("cycle", pa.float64()), ("value_added", pa.bool_()),
+            ("predicted_wait", pa.float64()), ("timestamp", pa.timestamp("s"))
+        ])
+    }
+
+
+def _month(ts: Optional[str]) -> str:
+    return ts[:7] if ts else "unknown"
+
+
+def _partition_dir(root: str, table: str, month: str, process: Optional[str]) -> str:
+    # hive-style segments, URI-encoded so any process name is a valid directory
+    return os.path.join(root, table, f"month={quote(month, safe='')}",
+                        f"process={quote(process or DEFAULT_PROCESS, safe='')}")
+
+
+class AnalyticsExporter:
+    """Export incrémental SQLite + vsm_output/ vers Parquet partitionné."""
+
+    ANALYSES_SQL = '''
+        SELECT id, process_name, lead_time, va_ratio, total_cost, nb_steps,
+               bottleneck_step, alerts_json, timestamp
+        FROM analyses
+        WHERE id > ?
+        ORDER BY id
+    '''
+
+    STEPS_SQL = '''
+        SELECT h.id, h.analysis_id, a.process_name, h.step_name, h.cycle_time,
+               h.wait_time, h.cost, h.value_added, h.timestamp
+        FROM step_history h
+        LEFT JOIN analyses a ON a.id = h.analysis_id
+        WHERE h.id > ?
+        ORDER BY h.id
+    '''
+
+    def __init__(self, db_path: str = "vsm_data.db", output_folder: str = "vsm_output",
+                 store_path: str = DEFAULT_STORE_PATH, chunk_size: int = 50000,
+                 max_files_per_partition: int = 4):
+        self.db_path = db_path
+        self.output_folder = output_folder
+        self.store_path = store_path
+        self.chunk_size = chunk_size
+        self.max_files_per_partition = max_files_per_partition
+        self._touched = set()
+
+    # --- watermark -------------------------------------------------------
+
+    def read_watermark(self) -> Dict[str, Any]:
+        path = os.path.join(self.store_path, WATERMARK_FILE)
+        if not os.path.exists(path):
+            return {"analyses": 0, "step_history": 0, "outputs": ""}
+        with open(path, encoding="utf-8") as f:
+            watermark = json.load(f)
+        if watermark.get("outputs") and not OUTPUT_NAME.match(watermark["outputs"]):
+            # set by an older exporter from an unrelated *.json name: recover it from the store
+            watermark["outputs"] = self._last_exported_output()
+        return watermark
+
+    def _last_exported_output(self) -> str:
+        t = AnalyticsStore(self.store_path).scan("output_steps", ["file"])
+        if t is None:
+            return ""
+        return max((n for n in set(t.column("file").to_pylist()) if n and OUTPUT_NAME.match(n)), default="")
+
+    def _write_watermark(self, watermark: Dict[str, Any]):
+        os.makedirs(self.store_path, exist_ok=True)
+        path = os.path.join(self.store_path, WATERMARK_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(watermark, f, indent=2)
+        os.replace(tmp, path)  # atomic: a crash never leaves a half-written watermark
+
+    # --- writing ---------------------------------------------------------
+
+    def _write_partitions(self, table: str, rows: List[Dict[str, Any]], part_name: str) -> int:
+        """Écrire des lignes (déjà triées) dans leurs partitions mois/processus"""
+        pa = _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        groups = {}
+        for r in rows:
+            key = (_month(r["timestamp"]), r["process_name"])
+            groups.setdefault(key, []).append(r)
+        for (month, process), group in groups.items():
+            directory = _partition_dir(self.store_path, table, month, process)
+            os.makedirs(directory, exist_ok=True)
+            # partition columns live in the path, not in the file
+            for r in group:
+                r["timestamp"] = datetime.fromisoformat(r["timestamp"]) if r["timestamp"] else None
+            table_data = pa.Table.from_pylist(group, schema=_schemas(pa)[table])
+            pq.write_table(table_data, os.path.join(directory, f"part-{part_name}.parquet"))
+            self._touched.add((table, directory))
+        return len(rows)
+
+    # --- compaction ------------------------------------------------------
+
+    def _compact_partition(self, table: str, directory: str, max_files: int) -> bool:
+        """Fusionner les fichiers d'une partition mois/processus s'ils sont plus de max_files"""
+        pa = _require_pyarrow()
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        for name in os.listdir(directory):
+            if name.startswith(".compact-"):
+                os.remove(os.path.join(directory, name))  # left by an interrupted compaction
+        parts = sorted(n for n in os.listdir(directory) if n.startswith("part-") and n.endswith(".parquet"))
+        if len(parts) <= max_files:
+            return False
+
+        merged = pa.concat_tables([pq.ParquetFile(os.path.join(directory, n)).read() for n in parts])
+        # keep the first copy of each record, in key order
+        keys = list(ROW_KEYS[table])
+        merged = merged.append_column("__row", pa.array(range(merged.num_rows), pa.int64()))
+        first = merged.group_by(keys, use_threads=False).aggregate([("__row", "min")]).column("__row_min")
+        merged = merged.take(first).drop_columns(["__row"]).sort_by([(k, "ascending") for k in keys])
+
+        lo, hi = pc.min_max(merged.column(keys[0])).values()
+        if table == "output_steps":
+            name = f"part-{os.path.splitext(lo.as_py())[0]}-{os.path.splitext(hi.as_py())[0]}.parquet"
+        else:
+            name = f"part-{lo.as_py():012d}-{hi.as_py():012d}.parquet"
+        # hidden temporary name: readers never list it, then an atomic rename
+        tmp = os.path.join(directory, f".compact-{name}")
+        pq.write_table(merged, tmp)
+        os.replace(tmp, os.path.join(directory, name))
+        for n in parts:
+            if n != name:
+                os.remove(os.path.join(directory, n))
+        return True
+
+    def compact(self, max_files: int = 1) -> int:
+        """Compacter toutes les partitions; retourne le nombre de partitions réécrites"""
+        compacted = 0
+        for table in ROW_KEYS:
+            root = os.path.join(self.store_path, table)
+            if not os.path.isdir(root):
+                continue
+            for month in sorted(os.listdir(root)):
+                month_dir = os.path.join(root, month)
+                if not os.path.isdir(month_dir):
+                    continue
+                for process in sorted(os.listdir(month_dir)):
+                    directory = os.path.join(month_dir, process)
+                    if os.path.isdir(directory) and self._compact_partition(table, directory, max_files):
+                        compacted += 1
+        return compacted
+
+    def _export_sql(self, table: str, sql: str, last_id: int, to_row, watermark: Dict[str, Any]) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            c = conn.cursor()
+            c.execute(sql, (last_id,))
+            written = 0
+            while True:
+                chunk = c.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+                rows = [to_row(r) for r in chunk]
+                written += self._write_partitions(table, rows, f"{rows[0]['id']:012d}-{rows[-1]['id']:012d}")
+                watermark[table] = rows[-1]["id"]
+                self._write_watermark(watermark)
+        finally:
+            conn.close()
+        return written
+
+    def _export_outputs(self, watermark: Dict[str, Any]) -> int:
+        if not os.path.isdir(self.output_folder):
+            return 0
+        # other *.json files (e.g. load-test fixtures) must not move the watermark
+        names = sorted(n for n in os.listdir(self.output_folder)
+                       if OUTPUT_NAME.match(n) and n > watermark.get("outputs", ""))
+        written = 0
+        for start in range(0, len(names), 500):
+            batch = names[start:start + 500]
+            rows = []
+            for name in batch:
+                try:
+                    with open(os.path.join(self.output_folder, name), encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                summary = data.get("summary", {})
+                ts = (data.get("analysis_timestamp") or "").rstrip("Z")[:19] or None
+                for t in data.get("timeline", []):
+                    rows.append({
+                        "file": name,
+                        "process_name": data.get("process") or summary.get("process"),
+                        "lead_time": summary.get("lead_time"),
+                        "va_ratio": summary.get("va_ratio"),
+                        "step_name": t.get("name"),
+                        "start": t.get("start"),
+                        "end": t.get("end"),
+                        "wait": t.get("wait"),
+                        "cycle": t.get("cycle"),
+                        "value_added": bool(t.get("value_added")),
+                        "predicted_wait": t.get("predicted_wait"),
+                        "timestamp": ts
+                    })
+            if rows:
+                written += self._write_partitions("output_steps", rows, os.path.splitext(batch[-1])[0])
+            watermark["outputs"] = batch[-1]
+            self._write_watermark(watermark)
+        return written
+
+    def export(self) -> Dict[str, int]:
+        """Exporter uniquement les lignes postérieures au watermark, puis compacter les partitions modifiées"""
+        _require_pyarrow()
+        watermark = self.read_watermark()
+        self._touched = set()
+        counts = {
+            "analyses": self._export_sql("analyses", self.ANALYSES_SQL, watermark.get("analyses", 0), lambda r: {
+                "id": r[0], "process_name": r[1], "lead_time": r[2], "va_ratio": r[3],
+                "total_cost": r[4], "nb_steps": r[5], "bottleneck_step": r[6],
+                "alert_count": len(json.loads(r[7] or "[]")), "timestamp": r[8]
+            }, watermark),
+            "step_history": self._export_sql("step_history", self.STEPS_SQL, watermark.get("step_history", 0), lambda r: {
+                "id": r[0], "analysis_id": r[1], "process_name": r[2], "step_name": r[3],
+                "cycle_time": r[4], "wait_time": r[5], "cost": r[6],
+                "value_added": bool(r[7]), "timestamp": r[8]
+            }, watermark),
+            "output_steps": self._export_outputs(watermark)
+        }
+        for table, directory in sorted(self._touched):
+            self._compact_partition(table, directory, self.max_files_per_partition)
+        watermark["exported_at"] = datetime.utcnow().isoformat(timespec="seconds")
+        self._write_watermark(watermark)
+        return counts
+
+
+class AnalyticsStore:
+    """Lecture et agrégats sur le stockage Parquet produit par AnalyticsExporter."""
+
+    def __init__(self, store_path: str = DEFAULT_STORE_PATH):
+        _require_pyarrow()
+        self.store_path = store_path
+
+    def exported_at(self) -> Optional[datetime]:
+        """Date (UTC) du dernier export: les agrégats ne voient rien de plus récent"""
+        path = os.path.join(self.store_path, WATERMARK_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            value = json.load(f).get("exported_at")
+        return datetime.fromisoformat(value) if value else None
+
+    def scan(self, table: str, columns: Optional[List[str]] = None, filter=None):
+        """
+        Retourne une pyarrow.Table; `filter` est une expression pyarrow.dataset
+        (les colonnes de partition `month` et `process` permettent d'élaguer les fichiers).
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        path = os.path.join(self.store_path, table)
+        if not os.path.isdir(path):
+            return None
+        partitioning = ds.partitioning(pa.schema([("month", pa.string()), ("process", pa.string())]),
+                                       flavor="hive")
+        dataset = ds.dataset(path, schema=_schemas(pa)[table].append(pa.field("month", pa.string()))
+                             .append(pa.field("process", pa.string())),
+                             format="parquet", partitioning=partitioning)
+        return dataset.to_table(columns=columns, filter=filter)
+
+    def _recent(self, table: str, columns: List[str], days: int):
+        import pyarrow.dataset as ds
+
+        since = datetime.utcnow() - timedelta(days=days)
+        # month prunes whole partitions, timestamp filters within them
+        flt = (ds.field("month") >= since.strftime("%Y-%m")) & (ds.field("timestamp") >= since)
+        return self.scan(table, columns, flt)
+
+    def history_summary(self, days: int = 30):
+        """(nb_analyses, avg_lead, avg_va, best_lead, worst_lead) sur la période"""
+        import pyarrow.compute as pc
+
+        t = self._recent("analyses", ["lead_time", "va_ratio"], days)
+        if t is None or t.num_rows == 0:
+            return (0, None, None, None, None)
+        lead = t.column("lead_time")
+        return (t.num_rows, pc.mean(lead).as_py(), pc.mean(t.column("va_ratio")).as_py(),
+                pc.min(lead).as_py(), pc.max(lead).as_py())
+
+    def bottleneck_counts(self, limit: int = 3):
+        """[(étape, occurrences)] des goulots les plus fréquents"""
+        t = self.scan("analyses", ["bottleneck_step"])
+        if t is None or t.num_rows == 0:
+            return []
+        counts = t.filter(t.column("bottleneck_step").is_valid()).group_by("bottleneck_step").aggregate(
+            [("bottleneck_step", "count")])
+        rows = sorted(zip(counts.column("bottleneck_step").to_pylist(),
+                          counts.column("bottleneck_step_count").to_pylist()),
+                      key=lambda r: r[1], reverse=True)
+        return rows[:limit]
+
+    def daily_costs(self, days: int = 7):
+        """[(date, coût total)] par jour, du plus récent au plus ancien"""
+        import pyarrow.compute as pc
+
+        t = self._recent("analyses", ["total_cost", "timestamp"], days)
+        if t is None or t.num_rows == 0:
+            return []
+        t = t.append_column("date", pc.strftime(t.column("timestamp"), format="%Y-%m-%d"))
+        costs = t.group_by("date").aggregate([("total_cost", "sum")])
+        return sorted(zip(costs.column("date").to_pylist(), costs.column("total_cost_sum").to_pylist()),
+                      reverse=True)
+
+    def process_summary(self):
+        """Agrégats par processus: nb analyses, lead time moyen, VA ratio moyen, coût total"""
+        t = self.scan("analyses", ["process", "lead_time", "va_ratio", "total_cost"])
+        if t is None or t.num_rows == 0:
+            return []
+        agg = t.group_by("process").aggregate([
+            ("lead_time", "count"), ("lead_time", "mean"), ("va_ratio", "mean"), ("total_cost", "sum")
+        ])
+        return [{
+            "process": r["process"],
+            "nb_analyses": r["lead_time_count"],
+            "avg_lead_time": r["lead_time_mean"],
+            "avg_va_ratio": r["va_ratio_mean"],
+            "total_cost": r["total_cost_sum"]
+        } for r in agg.to_pylist()]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export analytique Parquet de l'historique VSM")
+    parser.add_argument("command", choices=["export", "compact", "summary"])
+    parser.add_argument("--db", default="vsm_data.db")
+    parser.add_argument("--outputs", default="vsm_output")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        counts = AnalyticsExporter(args.db, args.outputs, args.store).export()
+        print(json.dumps(counts, indent=2))
+    elif args.command == "compact":
+        print(json.dumps({"compacted_partitions": AnalyticsExporter(args.db, args.outputs, args.store).compact()}))
+    else:
+        store = AnalyticsStore(args.store)
+        print(json.dumps({
+            "processes": store.process_summary(),
+            "bottlenecks": store.bottleneck_counts(),
+            "history_30d": store.history_summary(30)
+        }, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
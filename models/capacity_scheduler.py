@@ -0,0 +1,139 @@
+# models/capacity_scheduler.py
+from typing import Dict, List, Any, Optional, Tuple
+import heapq
+
+
+def _normalize_resources(resources: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Accepte {"Presse": 1, "Equipe A": 2} ou {"Presse": {"capacity": 1}}.
+    Une capacité doit être un entier >= 1.
+    """
+    capacities = {}
+    for name, spec in (resources or {}).items():
+        cap = spec.get("capacity", 1) if isinstance(spec, dict) else spec
+        # no silent truncation: 1.5 or True are rejected, 2.0 and "2" are accepted as 2
+        value = cap.strip() if isinstance(cap, str) else cap
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or not float(value).is_integer() or value < 1:
+            raise ValueError(f"Capacité invalide pour la ressource {name}: {cap}")
+        capacities[name] = int(value)
+    return capacities
+
+
+def schedule_with_capacity(steps: List[Dict[str, Any]],
+                           resources: Optional[Dict[str, Any]] = None
+                           ) -> Tuple[List[Dict[str, Any]], float, Dict[str, Any]]:
+    """
+    Ordonnancement par liste avec ressources partagées.
+
+    - Une étape peut déclarer "resource"; une ressource non déclarée a une capacité de 1.
+    - Les étapes sans ressource ont une capacité illimitée (comme compute_dependency_flow).
+    - Les étapes prêtes sont extraites d'un tas trié par (date de disponibilité, ordre d'entrée);
+      chaque ressource garde un tas des dates de libération de ses unités.
+      Complexité O((V+E) log V).
+
+    Retourne (étapes planifiées, lead time, rapport capacité).
+    """
+    capacities = _normalize_resources(resources)
+    steps_copy = [dict(s) for s in steps]
+    index = {s["name"]: i for i, s in enumerate(steps_copy)}
+
+    # graph: deduplicated known deps, without self-dependencies
+    parents = []
+    children = [[] for _ in steps_copy]
+    indeg = [0] * len(steps_copy)
+    for i, s in enumerate(steps_copy):
+        deps = []
+        for d in set(s.get("depends_on", []) or []):
+            j = index.get(d)
+            if j is not None and j != i:
+                deps.append(j)
+                children[j].append(i)
+        parents.append(deps)
+        indeg[i] = len(deps)
+
+    # one heap of unit free-times per resource
+    free_at = {}
+    for s in steps_copy:
+        res = s.get("resource")
+        if res and res not in free_at:
+            free_at[res] = [0.0] * capacities.setdefault(res, 1)
+    busy = {res: 0.0 for res in free_at}
+
+    ready_at = [0.0] * len(steps_copy)
+    done = [False] * len(steps_copy)
+    ordered = []
+
+    def place(i: int) -> float:
+        s = steps_copy[i]
+        ready = ready_at[i]
+        cycle = float(s.get("cycle_time", 0.0))
+        res = s.get("resource")
+        if res:
+            start = max(ready, heapq.heappop(free_at[res]))
+            heapq.heappush(free_at[res], start + cycle)
+            busy[res] += cycle
+        else:
+            start = ready
+        end = start + cycle
+        s["wait_time"] = round(start, 2)   # waiting until start
+        s["start_time"] = round(start, 2)
+        s["end_time"] = round(end, 2)
+        s["capacity_wait"] = round(start - ready, 2)
+        s["_predicted_wait"] = False
+        s["_delay"] = start - ready
+        s["_end"] = end
+        done[i] = True
+        ordered.append(s)
+        return end
+
+    heap = [(0.0, i) for i in range(len(steps_copy)) if indeg[i] == 0]
+    heapq.heapify(heap)
+    while heap:
+        _, i = heapq.heappop(heap)
+        end = place(i)
+        for c in children[i]:
+            if end > ready_at[c]:
+                ready_at[c] = end
+            indeg[c] -= 1
+            if indeg[c] == 0:
+                heapq.heappush(heap, (ready_at[c], c))
+
+    # cycle: schedule remaining steps in input order after their completed parents
+    for i in range(len(steps_copy)):
+        if not done[i]:
+            ready_at[i] = max((steps_copy[j]["_end"] for j in parents[i] if done[j]), default=0.0)
+            place(i)
+
+    total_lead = max((s["_end"] for s in ordered), default=0.0)
+
+    report = {"resources": {}, "binding_step": None, "binding_resource": None}
+    worst = {}
+    for s in ordered:
+        res = s.get("resource")
+        delay = s.pop("_delay")
+        del s["_end"]
+        if res and delay > 1e-9 and (res not in worst or delay > worst[res][1]):
+            worst[res] = (s["name"], delay)
+
+    for res, cap in capacities.items():
+        used = busy.get(res, 0.0)
+        report["resources"][res] = {
+            "capacity": cap,
+            "busy_time": round(used, 2),
+            "utilization": round(used / (cap * total_lead) * 100, 1) if total_lead > 0 else 0.0,
+            "binding_step": worst[res][0] if res in worst else None,
+            "max_capacity_wait": round(worst[res][1], 2) if res in worst else 0.0
+        }
+
+    if worst:
+        res, (name, _) = max(worst.items(), key=lambda kv: kv[1][1])
+        report["binding_step"] = name
+        report["binding_resource"] = res
+    elif report["resources"]:
+        report["binding_resource"] = max(report["resources"],
+                                         key=lambda r: report["resources"][r]["utilization"])
+
+    return ordered, round(total_lead, 2), report
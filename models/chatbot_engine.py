@@ -8,8 +8,13 @@ from flask import Flask, request, jsonify  # add jsonify here
 class VSMChatbot:
     """Chatbot intelligent avec mémoire et analyse d'historique"""
     
-    def __init__(self, db_path="vsm_data.db"):
+    def __init__(self, db_path="vsm_data.db", analytics_store=None):
+        """
+        analytics_store: AnalyticsStore optionnel; les agrégats d'historique sont alors
+        calculés sur l'export Parquet (à jour au dernier export) au lieu de SQLite.
+        """
         self.db_path = db_path
+        self.analytics_store = analytics_store
         self._init_database()
     
     def _init_database(self):
@@ -149,16 +154,16 @@ class VSMChatbot:
         
         # 2. Requêtes sur l'historique
         if any(word in msg_lower for word in ['historique', 'passé', 'tendance', 'évolution']):
-            return self._get_history_insights()
+            return self._with_store_age(self._get_history_insights())
         
         if any(word in msg_lower for word in ['meilleur', 'pire', 'comparaison']):
             return self._get_comparison()
         
         if 'goulot' in msg_lower or 'bottleneck' in msg_lower:
-            return self._get_bottleneck_analysis()
+            return self._with_store_age(self._get_bottleneck_analysis())
         
         if 'coût' in msg_lower or 'économie' in msg_lower:
-            return self._get_cost_analysis()
+            return self._with_store_age(self._get_cost_analysis())
         
         if 'amélioration' in msg_lower or 'recommandation' in msg_lower:
             return self._get_recommendations()
@@ -184,24 +189,37 @@ class VSMChatbot:
         conn.close()
         return None
     
+    def _with_store_age(self, response: str) -> str:
+        """Signaler l'âge des données quand la réponse vient de l'export Parquet"""
+        if self.analytics_store is None:
+            return response
+        exported_at = self.analytics_store.exported_at()
+        if exported_at is None:
+            return response + "\n\n📦 Aucun export analytique: lancez `python -m models.analytics_store export`."
+        return response + (f"\n\n📦 Données de l'export du {exported_at:%d/%m/%Y %H:%M} UTC "
+                           "(`python -m models.analytics_store export` pour actualiser)")
+    
     def _get_history_insights(self) -> str:
         """Analyser les tendances historiques"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT 
-                COUNT(*) as nb_analyses,
-                AVG(lead_time) as avg_lead,
-                AVG(va_ratio) as avg_va,
-                MIN(lead_time) as best_lead,
-                MAX(lead_time) as worst_lead
-            FROM analyses
-            WHERE timestamp >= datetime('now', '-30 days')
-        ''')
-        
-        row = c.fetchone()
-        conn.close()
+        if self.analytics_store is not None:
+            row = self.analytics_store.history_summary(days=30)
+        else:
+            conn = sqlite3.connect(self.db_path)
+            c = conn.cursor()
+            
+            c.execute('''
+                SELECT 
+                    COUNT(*) as nb_analyses,
+                    AVG(lead_time) as avg_lead,
+                    AVG(va_ratio) as avg_va,
+                    MIN(lead_time) as best_lead,
+                    MAX(lead_time) as worst_lead
+                FROM analyses
+                WHERE timestamp >= datetime('now', '-30 days')
+            ''')
+            
+            row = c.fetchone()
+            conn.close()
         
         if not row or row[0] == 0:
             return "📊 Aucun historique disponible. Lancez quelques analyses pour voir les tendances !"
@@ -264,20 +282,23 @@ class VSMChatbot:
     
     def _get_bottleneck_analysis(self) -> str:
         """Analyser les goulots récurrents"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT bottleneck_step, COUNT(*) as occurrences
-            FROM analyses
-            WHERE bottleneck_step IS NOT NULL
-            GROUP BY bottleneck_step
-            ORDER BY occurrences DESC
-            LIMIT 3
-        ''')
-        
-        bottlenecks = c.fetchall()
-        conn.close()
+        if self.analytics_store is not None:
+            bottlenecks = self.analytics_store.bottleneck_counts(limit=3)
+        else:
+            conn = sqlite3.connect(self.db_path)
+            c = conn.cursor()
+            
+            c.execute('''
+                SELECT bottleneck_step, COUNT(*) as occurrences
+                FROM analyses
+                WHERE bottleneck_step IS NOT NULL
+                GROUP BY bottleneck_step
+                ORDER BY occurrences DESC
+                LIMIT 3
+            ''')
+            
+            bottlenecks = c.fetchall()
+            conn.close()
         
         if not bottlenecks:
             return "✅ Aucun goulot identifié dans l'historique !"
@@ -295,21 +316,24 @@ class VSMChatbot:
     
     def _get_cost_analysis(self) -> str:
         """Analyser l'évolution des coûts"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT 
-                DATE(timestamp) as date,
-                SUM(total_cost) as daily_cost
-            FROM analyses
-            WHERE timestamp >= datetime('now', '-7 days')
-            GROUP BY DATE(timestamp)
-            ORDER BY date DESC
-        ''')
-        
-        costs = c.fetchall()
-        conn.close()
+        if self.analytics_store is not None:
+            costs = self.analytics_store.daily_costs(days=7)
+        else:
+            conn = sqlite3.connect(self.db_path)
+            c = conn.cursor()
+            
+            c.execute('''
+                SELECT 
+                    DATE(timestamp) as date,
+                    SUM(total_cost) as daily_cost
+                FROM analyses
+                WHERE timestamp >= datetime('now', '-7 days')
+                GROUP BY DATE(timestamp)
+                ORDER BY date DESC
+            ''')
+            
+            costs = c.fetchall()
+            conn.close()
         
         if not costs:
             return "💰 Aucune donnée de coût disponible."
@@ -0,0 +1,434 @@
+# models/inference_service.py
+"""
+Service d'inférence local partagé entre les workers Flask.
+
+Un seul processus charge le MLAnalyzer; les workers s'y connectent par socket Unix
+(InferenceClient). Les requêtes concurrentes sont regroupées en micro-batchs
+(max_batch_size lignes, max_wait_ms d'attente maximum) puis les résultats sont
+redistribués à chaque appelant.
+
+Le canal (multiprocessing.connection, donc pickle) est authentifié par une clé secrète:
+VSM_INFERENCE_AUTHKEY, sinon un fichier de clé en mode 0600 créé par le service
+(VSM_INFERENCE_KEYFILE, par défaut dans un répertoire privé de l'utilisateur).
+
+Lancement:
+    python -m models.inference_service
+"""
+from typing import Dict, List, Any, Optional
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Connection, answer_challenge, deliver_challenge
+import argparse
+import logging
+import math
+import os
+import queue
+import secrets
+import socket
+import stat
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.0
+FEATURES = {
+    "wait": ("cycle_time", "cost", "value_added"),
+    "critical": ("cycle_time", "cost", "value_added", "wait_time")
+}
+
+
+def default_runtime_dir() -> str:
+    """Répertoire privé (0700) du socket et de la clé, hors de /tmp partagé"""
+    base = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vsm")
+
+
+def default_socket_path() -> str:
+    return os.path.join(default_runtime_dir(), "inference.sock")
+
+
+def _private_dir(path: str):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{path} n'appartient pas à l'utilisateur courant")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def load_authkey(keyfile: Optional[str] = None, create: bool = False) -> bytes:
+    """
+    Clé d'authentification du service: VSM_INFERENCE_AUTHKEY, sinon le fichier de clé
+    (keyfile, VSM_INFERENCE_KEYFILE ou <répertoire privé>/authkey).
+    create=True (côté service) génère une clé aléatoire si le fichier n'existe pas.
+    """
+    key = os.environ.get("VSM_INFERENCE_AUTHKEY")
+    if key:
+        return key.encode("utf-8")
+    path = keyfile or os.environ.get("VSM_INFERENCE_KEYFILE") or \
+        os.path.join(default_runtime_dir(), "authkey")
+    if create and not os.path.exists(path):
+        _private_dir(os.path.dirname(os.path.abspath(path)))
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # created concurrently by another process
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Clé du service d'inférence introuvable: {path} "
+                                "(démarrer le service ou définir VSM_INFERENCE_AUTHKEY)")
+    if stat.S_IMODE(os.stat(path).st_mode) & 0o077:
+        raise PermissionError(f"La clé {path} doit être en mode 0600")
+    with open(path, encoding="utf-8") as f:
+        key = f.read().strip()
+    if not key:
+        raise ValueError(f"Clé vide: {path}")
+    return key.encode("utf-8")
+
+
+def _clean_rows(kind: Any, rows: Any) -> List[Dict[str, float]]:
+    """Valider une requête reçue: une ligne invalide ne doit pas faire échouer le batch des autres"""
+    if kind not in FEATURES:
+        raise ValueError(f"Type de prédiction inconnu: {kind}")
+    if not isinstance(rows, list):
+        raise ValueError("Les lignes doivent être une liste de dictionnaires")
+    cleaned = []
+    for r in rows:
+        if not isinstance(r, dict):
+            raise ValueError("Les lignes doivent être une liste de dictionnaires")
+        row = {}
+        for key in FEATURES[kind]:
+            value = r.get(key, 0)
+            try:
+                row[key] = float(value or 0)
+            except (TypeError, ValueError):
+                row[key] = math.nan
+            if not math.isfinite(row[key]):
+                raise ValueError(f"Valeur invalide pour {key}: {value!r}")
+        cleaned.append(row)
+    return cleaned
+
+
+def _connect(address: str, authkey: bytes, timeout: float) -> Connection:
+    """Équivalent de Client() dont la connexion et l'authentification sont bornées par timeout"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # kernel-level timeouts on a blocking socket: they bound connect() while the backlog
+        # is full and survive detach(), so a stuck service cannot block the handshake either
+        tv = struct.pack("ll", int(timeout), int(timeout % 1 * 1e6))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, tv)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, tv)
+        sock.connect(address)
+        conn = Connection(sock.detach())
+    except BlockingIOError:
+        raise TimeoutError(f"Connexion au service d'inférence impossible en {timeout}s")
+    finally:
+        sock.close()
+    try:
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except BlockingIOError:
+        conn.close()
+        raise TimeoutError(f"Pas de réponse du service d'inférence en {timeout}s")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def _wait_features(s: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "cycle_time": s.get("cycle_time", 0),
+        "cost": s.get("cost", 0),
+        "value_added": bool(s.get("value_added"))
+    }
+
+
+def _critical_features(s: Dict[str, Any]) -> Dict[str, Any]:
+    row = _wait_features(s)
+    row["wait_time"] = s.get("wait_time", 0)
+    return row
+
+
+class _Pending:
+    """Requête en attente de son micro-batch"""
+
+    def __init__(self, kind: str, rows: List[Dict[str, Any]]):
+        self.kind = kind
+        self.rows = rows
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceServer:
+    """
+    Possède un MLAnalyzer et sert des prédictions par micro-batchs.
+    Un batch ne dépasse pas max_batch_size lignes, sauf une requête plus grande à elle seule
+    (elle forme alors son propre batch).
+    """
+
+    def __init__(self, address: Optional[str] = None, ml=None, max_batch_size: int = 256,
+                 max_wait_ms: float = 5.0, authkey: Optional[bytes] = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être >= 1")
+        if ml is None:
+            from .ai_engine import MLAnalyzer
+            ml = MLAnalyzer()
+        self.ml = ml
+        if address is None:
+            address = default_socket_path()
+            _private_dir(os.path.dirname(address))
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(address)), mode=0o700, exist_ok=True)
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.authkey = authkey if authkey is not None else load_authkey(create=True)
+        self._queue = queue.Queue()
+        self._listener = None
+        self._closed = threading.Event()
+        self.stats = {"requests": 0, "batches": 0, "rows": 0}
+
+    def start(self) -> "InferenceServer":
+        """Démarrer le service dans des threads d'arrière-plan"""
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family="AF_UNIX", backlog=64, authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        logger.info("Service d'inférence à l'écoute sur %s", self.address)
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._closed.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed.is_set():
+                    return
+                logger.exception("Connexion refusée")
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while not self._closed.is_set():
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                except Exception as e:  # unpicklable payload
+                    conn.send(("error", f"Message illisible: {e}"))
+                    continue
+                try:
+                    if not isinstance(message, tuple) or len(message) != 2:
+                        raise ValueError("Message attendu: (type, lignes)")
+                    kind, rows = message
+                    rows = _clean_rows(kind, rows)
+                except ValueError as e:
+                    conn.send(("error", str(e)))
+                    continue
+                pending = _Pending(kind, rows)
+                self._queue.put(pending)
+                pending.done.wait()
+                if pending.error is not None:
+                    conn.send(("error", pending.error))
+                else:
+                    conn.send(("ok", pending.result))
+
+    def _batch_loop(self):
+        carry = None  # request that did not fit in the previous batch
+        while not self._closed.is_set():
+            batch = []
+            try:
+                if carry is not None:
+                    first, carry = carry, None
+                else:
+                    try:
+                        first = self._queue.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                batch.append(first)
+                size = len(first.rows)
+                deadline = time.perf_counter() + self.max_wait
+                # collect concurrent requests until the batch is full or the wait budget is spent
+                while size < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if size + len(item.rows) > self.max_batch_size:
+                        carry = item
+                        break
+                    batch.append(item)
+                    size += len(item.rows)
+                self._run_batch(batch)
+            except Exception as e:
+                # fail this batch only: the loop must survive for every later caller
+                logger.exception("Erreur du micro-batch")
+                for p in batch:
+                    if not p.done.is_set():
+                        p.error = str(e)
+                        p.done.set()
+
+    def _run_batch(self, batch: List[_Pending]):
+        for kind in ("wait", "critical"):
+            group = [p for p in batch if p.kind == kind]
+            if not group:
+                continue
+            rows = [r for p in group for r in p.rows]
+            try:
+                if kind == "wait":
+                    preds = self.ml.predict_wait_times(rows)
+                else:
+                    preds = self.ml.predict_critical_flags(rows)
+            except Exception as e:
+                logger.exception("Erreur d'inférence")
+                for p in group:
+                    p.error = str(e)
+                    p.done.set()
+                continue
+            # fan results back out to each caller
+            offset = 0
+            for p in group:
+                p.result = preds[offset:offset + len(p.rows)]
+                offset += len(p.rows)
+                p.done.set()
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(group)
+            self.stats["rows"] += len(rows)
+
+
+class InferenceClient:
+    """
+    Remplace MLAnalyzer côté worker: mêmes méthodes de prédiction, exécutées par le service.
+    Une connexion par thread (les connexions ne sont pas thread-safe).
+
+    Chaque appel est borné par timeout secondes. Avec local_fallback=True, un service absent,
+    lent ou arrêté est remplacé par un MLAnalyzer local (chargé au premier besoin) et n'est
+    plus sollicité pendant retry_after secondes; sinon l'erreur est levée.
+    """
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[bytes] = None,
+                 timeout: float = DEFAULT_TIMEOUT, local_fallback: bool = False,
+                 retry_after: float = 5.0):
+        self.address = address or default_socket_path()
+        self.authkey = authkey
+        self.timeout = timeout
+        self.local_fallback = local_fallback
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._down_until = 0.0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.authkey is None:
+                # read lazily: the service creates the key file when it starts
+                self.authkey = load_authkey()
+            conn = _connect(self.address, self.authkey, self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        # a late reply would desynchronise the stream: always reconnect after a failure
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def _remote(self, kind: str, rows: List[Dict[str, Any]]) -> List[Any]:
+        conn = self._conn()
+        try:
+            conn.send((kind, rows))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Pas de réponse du service d'inférence en {self.timeout}s")
+            status, payload = conn.recv()
+        except BaseException:
+            self._drop()
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Service d'inférence: {payload}")
+        return payload
+
+    def _local_ml(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                from .ai_engine import MLAnalyzer
+                self._fallback = MLAnalyzer()
+            return self._fallback
+
+    def _call(self, kind: str, rows: List[Dict[str, Any]]) -> List[Any]:
+        if not rows:
+            return []
+        if not self.local_fallback or time.monotonic() >= self._down_until:
+            try:
+                return self._remote(kind, rows)
+            except (OSError, EOFError, ValueError, AuthenticationError) as e:
+                # OSError covers a missing key or socket, a refused connection and timeouts
+                if not self.local_fallback:
+                    raise
+                logger.warning("Service d'inférence indisponible (%s): prédiction locale", e)
+                self._down_until = time.monotonic() + self.retry_after
+        ml = self._local_ml()
+        if kind == "wait":
+            return ml.predict_wait_times(rows)
+        return ml.predict_critical_flags(rows)
+
+    def predict_wait_time(self, step):
+        return self.predict_wait_times([step])[0]
+
+    def predict_wait_times(self, steps):
+        return self._call("wait", [_wait_features(s) for s in steps])
+
+    def predict_critical_flags(self, steps):
+        return self._call("critical", [_critical_features(s) for s in steps])
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Service d'inférence VSM par micro-batchs")
+    parser.add_argument("--socket", help=f"Chemin du socket Unix (défaut: {default_socket_path()})")
+    parser.add_argument("--authkey-file", help="Fichier de clé (défaut: VSM_INFERENCE_KEYFILE ou répertoire privé)")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    InferenceServer(args.socket, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                    authkey=load_authkey(args.authkey_file, create=True)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
 # models/vsm_analyzer.py
 from typing import Dict, List, Any
 from .ai_engine import MLAnalyzer
+from .capacity_scheduler import schedule_with_capacity
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+import hashlib
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 class VSMAnalyzer:
-    def __init__(self, enable_ai: bool = True):
+    SUBPROCESS_CACHE_SIZE = 256
+
+    def __init__(self, enable_ai: bool = True, ml=None, max_workers: int = 4):
+        """
+        ml: modèle à utiliser à la place d'un MLAnalyzer local, par ex. un
+        InferenceClient connecté au service d'inférence partagé.
+        max_workers: sous-processus indépendants analysés en parallèle.
+        """
         self.enable_ai = enable_ai
-        self.ml = MLAnalyzer() if enable_ai else None
+        if not enable_ai:
+            self.ml = None
+        else:
+            self.ml = ml if ml is not None else MLAnalyzer()
+        self.max_workers = max_workers
+        # sub-process results memoized by content hash (LRU)
+        self._subprocess_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def _topological_sort(self, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
@@ -77,9 +97,153 @@ class VSMAnalyzer:
         total_lead = max(completion.values()) if completion else 0.0
         return ordered, round(total_lead, 2)
 
+    def compute_capacity_flow(self, steps: List[Dict[str, Any]],
+                              resources: Dict[str, Any] = None) -> tuple[List[Dict[str, Any]], float, Dict[str, Any]]:
+        """
+        Variante de compute_dependency_flow avec ressources partagées (presse, équipe...):
+        une étape attend aussi qu'une unité de sa ressource soit libre.
+        Retourne aussi l'utilisation par ressource et l'étape qui contraint la capacité.
+        """
+        return schedule_with_capacity(steps, resources)
+
+    def _lookup_subprocess(self, ref, scopes: List[Dict[str, Any]], step: Dict[str, Any]):
+        """
+        Résoudre "subprocess" d'une étape: nom défini dans un "subprocesses" englobant, ou processus inline.
+        Retourne (sous-processus, nom, portées de sa définition): ses propres références se résolvent
+        là où il est défini, pas depuis l'étape qui l'utilise.
+        """
+        if isinstance(ref, dict):
+            return ref, ref.get("process_name") or step.get("name"), scopes
+        if isinstance(ref, str):
+            for depth in range(len(scopes) - 1, -1, -1):
+                if ref in scopes[depth]:
+                    if not isinstance(scopes[depth][ref], dict):
+                        raise ValueError(f"Sous-processus invalide: {ref}")
+                    return scopes[depth][ref], ref, scopes[:depth + 1]
+            raise ValueError(f"Sous-processus inconnu: {ref}")
+        raise ValueError(f"Sous-processus invalide pour l'étape {step.get('name')}")
+
+    def _collect_subprocesses(self, payload: Dict[str, Any]):
+        """
+        Parcourt l'arbre des sous-processus.
+        Retourne (nœuds par clé, références de la racine {index étape: clé nœud}); chaque nœud
+        a une hauteur (0 = feuille) pour l'analyse bottom-up.
+        """
+        nodes = {}
+
+        def visit(p, scopes, stack, label):
+            definitions = p.get("subprocesses") or {}
+            if not isinstance(definitions, dict):
+                raise ValueError(f"\"subprocesses\" doit être un objet {{nom: processus}} ({label})")
+            scopes = scopes + [definitions]
+            refs = {}
+            for i, s in enumerate(p.get("steps", [])):
+                if not s.get("subprocess"):
+                    continue
+                sub, name, defining = self._lookup_subprocess(s["subprocess"], scopes, s)
+                # a node is a definition in its defining scopes, whatever step reaches it first
+                key = (id(sub),) + tuple(id(scope) for scope in defining)
+                if key in stack:
+                    raise ValueError(f"Référence circulaire de sous-processus: {name}")
+                if key not in nodes:
+                    node = {"payload": sub, "name": name}
+                    nodes[key] = node
+                    node["refs"] = visit(sub, defining, stack | {key}, name)
+                    node["height"] = 1 + max((nodes[c]["height"] for c in node["refs"].values()), default=-1)
+                refs[i] = key
+            return refs
+
+        return nodes, visit(payload, [], set(), payload.get("process_name", "processus principal"))
+
+    def _resolved_payload(self, payload: Dict[str, Any], refs: Dict[int, int],
+                          results: Dict[int, Dict[str, Any]],
+                          default_name: str = "Processus non défini") -> Dict[str, Any]:
+        """Remplacer cycle_time / cost des étapes sous-processus par lead time / coût du sous-processus"""
+        steps = []
+        for i, s in enumerate(payload.get("steps", [])):
+            if i in refs:
+                r = results[refs[i]]
+                s = dict(s, cycle_time=r["summary"]["lead_time"],
+                         cost=round(sum(x["cost"] for x in r["steps"]), 2), subprocess=r["process"])
+            steps.append(s)
+        resolved = {"process_name": payload.get("process_name", default_name), "steps": steps}
+        if payload.get("resources"):
+            resolved["resources"] = payload["resources"]
+        return resolved
+
+    def _analyze_subprocess(self, node: Dict[str, Any], results: Dict[int, Dict[str, Any]]):
+        """Analyse d'un sous-processus, mémoïsée par hash du contenu résolu"""
+        resolved = self._resolved_payload(node["payload"], node["refs"], results, node["name"])
+        digest = hashlib.sha256(json.dumps(resolved, sort_keys=True, ensure_ascii=False,
+                                           default=str).encode("utf-8")).hexdigest()
+        with self._cache_lock:
+            cached = self._subprocess_cache.get(digest)
+            if cached is not None:
+                self._subprocess_cache.move_to_end(digest)
+                return cached, digest, True
+        result = self._analyze_flat(resolved)
+        with self._cache_lock:
+            self._subprocess_cache[digest] = result
+            while len(self._subprocess_cache) > self.SUBPROCESS_CACHE_SIZE:
+                self._subprocess_cache.popitem(last=False)
+        return result, digest, False
+
     def analyze(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analyse VSM. Une étape peut référencer un sous-processus ("subprocess": nom défini dans
+        "subprocesses", ou processus inline): son cycle_time et son coût viennent alors du lead
+        time et du coût total du sous-processus. L'arbre est résolu bottom-up: chaque sous-processus
+        est lancé dès que ses propres sous-processus sont analysés, les branches indépendantes en
+        parallèle. Chaque résultat est mémoïsé par hash de son contenu, si bien que modifier une
+        ligne ne ré-analyse que cette ligne et ses ancêtres.
+        """
+        if not any(s.get("subprocess") for s in payload.get("steps", [])):
+            return self._analyze_flat(payload)
+
+        nodes, root_refs = self._collect_subprocesses(payload)
+        parents = {key: [] for key in nodes}
+        pending = {}  # children not analysed yet, per node
+        for key, node in nodes.items():
+            children = set(node["refs"].values())
+            pending[key] = len(children)
+            for c in children:
+                parents[c].append(key)
+
+        results = {}
+        report = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {pool.submit(self._analyze_subprocess, nodes[k], results): k
+                       for k in nodes if pending[k] == 0}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    result, digest, cached = future.result()
+                    results[key] = result
+                    # submit each parent as soon as its last child is done
+                    for p in parents[key]:
+                        pending[p] -= 1
+                        if pending[p] == 0:
+                            running[pool.submit(self._analyze_subprocess, nodes[p], results)] = p
+                    report.append({
+                        "name": nodes[key]["name"],
+                        "level": nodes[key]["height"],
+                        "hash": digest,
+                        "cached": cached,
+                        "lead_time": result["summary"]["lead_time"],
+                        "total_cost": round(sum(s["cost"] for s in result["steps"]), 2),
+                        "nb_steps": result["summary"]["nb_steps"]
+                    })
+
+        result = self._analyze_flat(self._resolved_payload(payload, root_refs, results))
+        # completion order varies between runs: keep the response stable for the same input
+        result["subprocesses"] = sorted(report, key=lambda r: (r["level"], r["name"], r["hash"]))
+        return result
+
+    def _analyze_flat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         steps_in = payload.get("steps", [])
         process_name = payload.get("process_name", "Processus non défini")
+        resources = payload.get("resources") or {}
         # Ensure each step has required fields and a unique name
         validated = []
         seen = set()
@@ -90,23 +254,32 @@ class VSMAnalyzer:
             if name in seen:
                 raise ValueError(f"Nom d'étape dupliqué: {name}")
             seen.add(name)
-            validated.append({
+            step = {
                 "name": name,
                 "cycle_time": float(s.get("cycle_time", 0.0)),
                 "cost": float(s.get("cost", 0.0)),
                 "value_added": bool(s.get("value_added", False)),
                 "depends_on": s.get("depends_on", []) or []
-            })
+            }
+            if s.get("resource"):
+                step["resource"] = s["resource"]
+            if s.get("subprocess"):
+                step["subprocess"] = s["subprocess"]
+            validated.append(step)
 
-        # compute dependency-driven schedule
-        ordered_steps, lead_time = self.compute_dependency_flow(validated)
+        # compute dependency-driven schedule (capacity-aware if resources are declared)
+        capacity = None
+        if resources or any("resource" in s for s in validated):
+            ordered_steps, lead_time, capacity = self.compute_capacity_flow(validated, resources)
+        else:
+            ordered_steps, lead_time = self.compute_dependency_flow(validated)
 
         # If ML available: predict waits and detect critical steps
         alerts = []
         if self.enable_ai and self.ml:
             # predict waits and mark predicted if predicted > scheduled start (indicates buffer)
-            for s in ordered_steps:
-                pred_wait = self.ml.predict_wait_time(s)
+            preds = self.ml.predict_wait_times(ordered_steps)
+            for s, pred_wait in zip(ordered_steps, preds):
                 s["predicted_wait"] = pred_wait
                 # if predicted_wait (model) > schedule start_time => indicates potential extra waiting
                 if pred_wait > s["start_time"] + 0.001:
@@ -135,15 +308,27 @@ class VSMAnalyzer:
             "predicted_wait": s.get("predicted_wait"),
             "predicted_flag": s.get("_predicted_wait", False)
         } for s in ordered_steps]
+        if capacity is not None:
+            for t, s in zip(timeline, ordered_steps):
+                t["resource"] = s.get("resource")
+                t["capacity_wait"] = s["capacity_wait"]
 
         # build report text (simple, local) - AVEC les alertes intégrées
         report_lines = [
             f"Rapport VSM - {process_name}",
             f"Lead time planifié: {lead_time} h",
             f"VA ratio: {va_ratio} %",
+        ]
+        if capacity is not None:
+            for res, r in capacity["resources"].items():
+                report_lines.append(f"Ressource {res} (capacité {r['capacity']}): utilisation {r['utilization']} %")
+            if capacity["binding_step"]:
+                report_lines.append(f"Étape contrainte par la capacité: {capacity['binding_step']} "
+                                    f"({capacity['binding_resource']})")
+        report_lines.extend([
             "",
             "Alertes détectées:"
-        ]
+        ])
         if alerts:
             for a in alerts:
                 report_lines.append(f"- {a}")
@@ -174,4 +359,8 @@ class VSMAnalyzer:
             "analysis_timestamp": datetime.utcnow().isoformat() + "Z",
             "steps": ordered_steps
         }
+        if capacity is not None:
+            result["summary"]["binding_step"] = capacity["binding_step"]
+            result["summary"]["binding_resource"] = capacity["binding_resource"]
+            result["resources"] = capacity["resources"]
         return result
\ No newline at end of file
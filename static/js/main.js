@@ -2,11 +2,25 @@
 let steps = []; // array of {name, cycle_time, wait_time, cost, value_added, depends_on}
 let chart = null;
 
+// virtualized table: only rows in the viewport (+ overscan) are in the DOM
+const OVERSCAN = 8;
+const MAX_CHART_BARS = 200; // larger timelines are decimated into buckets
+// CSV import: a first line is a header only if its first columns are named like the table's
+const IMPORT_HEADER_NAME = /^(nom|name|étape|etape|step)$/i;
+const IMPORT_HEADER_CYCLE = /^(cycle|cycle_time|cycle \(h\)|temps cycle)$/i;
+let rowHeight = 54; // measured after the first rendered row
+let renderedRange = [0, 0];
+let scrollScheduled = false;
+
 // DOM refs
 const stepsBody = document.getElementById("stepsBody");
+const stepsViewport = document.getElementById("stepsViewport");
 const addStepBtn = document.getElementById("addStepBtn");
 const analyzeBtn = document.getElementById("analyzeBtn");
 const clearStepsBtn = document.getElementById("clearStepsBtn");
+const importBtn = document.getElementById("importBtn");
+const importFile = document.getElementById("importFile");
+const importText = document.getElementById("importText");
 const sendChatBtn = document.getElementById("sendChat");
 const chatInput = document.getElementById("chatInput");
 const chatMessages = document.getElementById("chatMessages");
@@ -17,6 +31,25 @@ analyzeBtn.addEventListener("click", analyzeProcess);
 clearStepsBtn.addEventListener("click", () => {
   steps = []; renderSteps(); document.getElementById('processInfo').classList.add('hidden');
 });
+importBtn.addEventListener("click", () => {
+  importSteps(importText.value); importText.value = '';
+});
+importFile.addEventListener("change", async () => {
+  const file = importFile.files[0];
+  if (file) importSteps(await file.text());
+  importFile.value = '';
+});
+// one delegated listener per event type instead of one per input
+stepsBody.addEventListener("change", handleStepInput);
+stepsBody.addEventListener("click", e => {
+  const btn = e.target.closest(".remove");
+  if (btn) removeStep(parseInt(btn.dataset.index, 10));
+});
+stepsViewport.addEventListener("scroll", () => {
+  if (scrollScheduled) return;
+  scrollScheduled = true;
+  requestAnimationFrame(() => { scrollScheduled = false; renderWindow(); });
+});
 sendChatBtn.addEventListener("click", sendChat);
 chatInput.addEventListener("keypress", handleChatKey);
 
@@ -24,9 +57,15 @@ chatInput.addEventListener("keypress", handleChatKey);
 renderSteps();
 
 // functions
-function addStepRow(prefill = {}) {
-  // append to steps array with defaults
-  const defaultStep = {
+function timed(label, fn) {
+  const t0 = performance.now();
+  const out = fn();
+  console.info(`[VSM] ${label}: ${(performance.now() - t0).toFixed(1)} ms`);
+  return out;
+}
+
+function makeStep(prefill = {}) {
+  return {
     name: prefill.name || `Step ${steps.length + 1}`,
     cycle_time: prefill.cycle_time || 1.0,
     wait_time: prefill.wait_time || 0,
@@ -34,42 +73,143 @@ function addStepRow(prefill = {}) {
     value_added: !!prefill.value_added,
     depends_on: prefill.depends_on || []
   };
-  steps.push(defaultStep);
+}
+
+function addStepRow(prefill = {}) {
+  // append to steps array with defaults
+  steps.push(makeStep(prefill));
   renderSteps();
+  stepsViewport.scrollTop = stepsViewport.scrollHeight;
 }
 
 function removeStep(index) {
+  if (isNaN(index) || index < 0 || index >= steps.length) return;
+  // blur first: a focused input commits its edit while its data-index is still valid
+  const active = document.activeElement;
+  if (active && stepsBody.contains(active)) active.blur();
   steps.splice(index, 1);
   renderSteps();
 }
 
+// Import CSV / copier-coller tableur: nom, cycle, coût, VA, dépendances (séparées par , ; ou |)
+function importSteps(text) {
+  const t0 = performance.now();
+  const lines = text.split(/\r?\n/).filter(l => l.trim());
+  if (!lines.length) return;
+  const delim = lines[0].includes('\t') ? '\t' : ',';
+  const [first, second] = parseCsvLine(lines[0], delim).map(f => f.trim());
+  const start = IMPORT_HEADER_NAME.test(first) && IMPORT_HEADER_CYCLE.test(second) ? 1 : 0; // skip header
+  const imported = [];
+  for (let i = start; i < lines.length; i++) {
+    const [name, cycle, cost, va, ...rest] = parseCsvLine(lines[i], delim);
+    const deps = rest.join(','); // unquoted "A,B" dependencies spill into extra fields
+    // same defaults as a row added by hand (blank cycle → 1.0, blank cost → 100)
+    imported.push(makeStep({
+      name: (name || '').trim() || `Step ${steps.length + imported.length + 1}`,
+      cycle_time: parseFloat(cycle),
+      cost: parseFloat(cost),
+      value_added: /^(1|true|oui|yes|x|va|✓)$/i.test((va || '').trim()),
+      depends_on: (deps || '').split(/[;|,]/).map(s => s.trim()).filter(Boolean)
+    }));
+  }
+  // single concat + single render, whatever the number of rows
+  steps = steps.concat(imported);
+  renderSteps();
+  console.info(`[VSM] import ${imported.length} étapes: ${(performance.now() - t0).toFixed(1)} ms`);
+}
+
+function parseCsvLine(line, delim) {
+  const out = [];
+  let cur = '', quoted = false;
+  for (let i = 0; i < line.length; i++) {
+    const ch = line[i];
+    if (quoted) {
+      if (ch === '"' && line[i + 1] === '"') { cur += '"'; i++; }
+      else if (ch === '"') quoted = false;
+      else cur += ch;
+    } else if (ch === '"') quoted = true;
+    else if (ch === delim) { out.push(cur); cur = ''; }
+    else cur += ch;
+  }
+  out.push(cur);
+  return out;
+}
+
 function renderSteps() {
-  stepsBody.innerHTML = "";
+  // full refresh: list length changed, so every window row may be stale
+  renderedRange = [0, 0];
+  timed(`renderSteps (${steps.length} étapes)`, renderWindow);
+  if (steps.length === 0) return;
+  document.getElementById('processInfo').classList.remove('hidden');
+  document.getElementById('processName').textContent = "Processus dynamique";
+}
+
+function renderWindow() {
   if (steps.length === 0) {
     stepsBody.innerHTML = `<tr><td colspan="6" style="text-align:center;padding:20px;color:#999">Ajoutez des étapes pour commencer</td></tr>`;
     return;
   }
-  steps.forEach((s, i) => {
-    const tr = document.createElement("tr");
-    tr.innerHTML = `
-      <td><input class="txt name" data-index="${i}" value="${escapeHtml(s.name)}" /></td>
-      <td><input type="number" step="0.1" class="num cycle" data-index="${i}" value="${s.cycle_time}" /></td>
-      <td><input type="number" step="1" class="num cost" data-index="${i}" value="${s.cost}" /></td>
-      <td style="text-align:center"><input type="checkbox" class="chk va" data-index="${i}" ${s.value_added ? "checked":""}></td>
-      <td><input class="txt deps" data-index="${i}" placeholder="Ex: Soudure,Peinture" value="${escapeHtml((s.depends_on||[]).join(','))}"></td>
-      <td><button class="btn btn-primary" onclick="removeStep(${i})">🗑️</button></td>
-    `;
-    stepsBody.appendChild(tr);
-  });
+  const first = Math.max(0, Math.floor(stepsViewport.scrollTop / rowHeight) - OVERSCAN);
+  const visible = Math.ceil(stepsViewport.clientHeight / rowHeight) + 2 * OVERSCAN;
+  const last = Math.min(steps.length, first + visible);
+  if (first === renderedRange[0] && last === renderedRange[1]) return;
+  renderedRange = [first, last];
 
-  // add listeners to inputs to update steps array on change
-  document.querySelectorAll(".name").forEach(inp => inp.onchange = handleStepInput);
-  document.querySelectorAll(".cycle").forEach(inp => inp.onchange = handleStepInput);
-  document.querySelectorAll(".cost").forEach(inp => inp.onchange = handleStepInput);
-  document.querySelectorAll(".va").forEach(inp => inp.onchange = handleStepInput);
-  document.querySelectorAll(".deps").forEach(inp => inp.onchange = handleStepInput);
-  document.getElementById('processInfo').classList.remove('hidden');
-  document.getElementById('processName').textContent = "Processus dynamique";
+  // commit a pending edit before its input leaves the DOM (buttons hold no data)
+  const active = document.activeElement;
+  if (active && active.tagName === "INPUT" && stepsBody.contains(active)) handleStepInput({target: active});
+
+  const frag = document.createDocumentFragment();
+  frag.appendChild(spacerRow(first * rowHeight));
+  for (let i = first; i < last; i++) frag.appendChild(buildRow(i));
+  frag.appendChild(spacerRow((steps.length - last) * rowHeight));
+  stepsBody.replaceChildren(frag);
+
+  const sample = stepsBody.querySelector(".step-row");
+  if (sample && sample.offsetHeight && sample.offsetHeight !== rowHeight) {
+    rowHeight = sample.offsetHeight;
+    renderedRange = [0, 0];
+    renderWindow();
+  }
+}
+
+function spacerRow(height) {
+  // the height sits on a full-width cell: browsers size empty rows inconsistently
+  const tr = document.createElement("tr");
+  tr.className = "spacer";
+  const td = document.createElement("td");
+  td.colSpan = 6;
+  td.style.height = `${height}px`;
+  tr.appendChild(td);
+  return tr;
+}
+
+function buildRow(i) {
+  const s = steps[i];
+  const tr = document.createElement("tr");
+  tr.className = "step-row";
+  tr.dataset.index = i;
+  tr.innerHTML = `
+    <td><input class="txt name" data-index="${i}" value="${escapeHtml(s.name)}" /></td>
+    <td><input type="number" step="0.1" class="num cycle" data-index="${i}" value="${s.cycle_time}" /></td>
+    <td><input type="number" step="1" class="num cost" data-index="${i}" value="${s.cost}" /></td>
+    <td style="text-align:center"><input type="checkbox" class="chk va" data-index="${i}" ${s.value_added ? "checked":""}></td>
+    <td><input class="txt deps" data-index="${i}" placeholder="Ex: Soudure,Peinture" value="${escapeHtml((s.depends_on||[]).join(','))}"></td>
+    <td><button class="btn btn-primary remove" data-index="${i}">🗑️</button></td>
+  `;
+  return tr;
+}
+
+// update one rendered row in place (no-op if the row is scrolled out)
+function updateRow(i) {
+  const tr = stepsBody.querySelector(`tr.step-row[data-index="${i}"]`);
+  if (!tr) return;
+  const s = steps[i];
+  tr.querySelector(".name").value = s.name;
+  tr.querySelector(".cycle").value = s.cycle_time;
+  tr.querySelector(".cost").value = s.cost;
+  tr.querySelector(".va").checked = !!s.value_added;
+  tr.querySelector(".deps").value = (s.depends_on || []).join(',');
 }
 
 function handleStepInput(e) {
@@ -89,11 +229,12 @@ function handleStepInput(e) {
   steps[idx].cost = cost;
   steps[idx].value_added = !!va;
   steps[idx].depends_on = deps;
+  if (!name) updateRow(idx);
 }
 
 async function analyzeProcess() {
-  // make sure we snapshot latest inputs
-  document.querySelectorAll(".name").forEach(n => n.dispatchEvent(new Event('change')));
+  // make sure we snapshot latest inputs (only rendered rows can hold unsaved edits)
+  stepsBody.querySelectorAll(".name").forEach(n => n.dispatchEvent(new Event('change', {bubbles: true})));
   if (steps.length === 0) return alert("Ajoutez des étapes avant l'analyse.");
 
   // build payload
@@ -121,21 +262,39 @@ async function analyzeProcess() {
     }
     showResults(data);
     addBotMessage(`📊 Analyse terminée. Lead time: ${data.summary.lead_time} h, VA ratio: ${data.summary.va_ratio}%`);
-    // update local steps with returned scheduling info
+    // update local steps with returned scheduling info (not shown in the table: no re-render)
     if (Array.isArray(data.steps)) {
-      // map back wait_time etc.
       data.steps.forEach((s, idx) => {
         if (steps[idx]) {
           steps[idx].wait_time = s.start_time || s.wait_time || s.wait;
         }
       });
-      renderSteps();
     }
   } catch (err) {
     alert("Erreur réseau: " + err.message);
   }
 }
 
+// Regroupe les étapes consécutives en au plus maxBars barres (max par groupe: les goulots restent visibles)
+function decimateTimeline(timeline, maxBars) {
+  if (timeline.length <= maxBars) {
+    return {
+      labels: timeline.map(t => t.name),
+      wait: timeline.map(t => t.wait),
+      cycle: timeline.map(t => t.cycle)
+    };
+  }
+  const size = Math.ceil(timeline.length / maxBars);
+  const out = {labels: [], wait: [], cycle: []};
+  for (let i = 0; i < timeline.length; i += size) {
+    const bucket = timeline.slice(i, i + size);
+    out.labels.push(`${bucket[0].name} … ${bucket[bucket.length - 1].name} (${bucket.length})`);
+    out.wait.push(Math.max(...bucket.map(t => t.wait)));
+    out.cycle.push(Math.max(...bucket.map(t => t.cycle)));
+  }
+  return out;
+}
+
 function showResults(data) {
   document.getElementById("resultsSection").classList.remove("hidden");
   document.getElementById("leadTime").textContent = data.summary.lead_time;
@@ -145,28 +304,34 @@ function showResults(data) {
   const totalCost = (data.steps || []).reduce((s,x)=> s + (x.cost || 0), 0);
   document.getElementById("totalCost").textContent = '$' + totalCost;
 
-  // Chart
-  const labels = data.timeline.map(t => t.name);
-  const waitData = data.timeline.map(t => t.wait);
-  const cycleData = data.timeline.map(t => t.cycle);
-
-  const ctx = document.getElementById("vsmChart").getContext("2d");
-  if (chart) chart.destroy();
-  chart = new Chart(ctx, {
-    type: 'bar',
-    data: {
-      labels,
-      datasets: [
-        { label: 'Temps Attente (h)', data: waitData, backgroundColor: '#ef4444' },
-        { label: 'Temps Cycle (h)', data: cycleData, backgroundColor: '#10b981' }
-      ]
-    },
-    options: {
-      indexAxis: 'y',
-      responsive: true,
-      maintainAspectRatio: false,
-      scales: { x: { stacked: false }, y: { stacked: false } }
+  // Chart: created once, then updated in place
+  timed(`chart (${data.timeline.length} étapes)`, () => {
+    const series = decimateTimeline(data.timeline, MAX_CHART_BARS);
+    if (chart) {
+      chart.data.labels = series.labels;
+      chart.data.datasets[0].data = series.wait;
+      chart.data.datasets[1].data = series.cycle;
+      chart.update('none');
+      return;
     }
+    const ctx = document.getElementById("vsmChart").getContext("2d");
+    chart = new Chart(ctx, {
+      type: 'bar',
+      data: {
+        labels: series.labels,
+        datasets: [
+          { label: 'Temps Attente (h)', data: series.wait, backgroundColor: '#ef4444' },
+          { label: 'Temps Cycle (h)', data: series.cycle, backgroundColor: '#10b981' }
+        ]
+      },
+      options: {
+        indexAxis: 'y',
+        responsive: true,
+        maintainAspectRatio: false,
+        animation: false,
+        scales: { x: { stacked: false }, y: { stacked: false } }
+      }
+    });
   });
 
   // report & alerts
@@ -0,0 +1,129 @@
+# tools/bench_inference.py
+"""
+Test de charge du service d'inférence: débit et latence p50/p99 de prédictions
+d'une seule étape (comme /api/analyze_step), avec et sans micro-batching.
+
+    python tools/bench_inference.py --clients 32 --requests 200
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # MLAnalyzer resolves its model files relative to the repo root
+
+from models.ai_engine import MLAnalyzer
+from models.inference_service import InferenceServer, InferenceClient
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    # nearest-rank percentile
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+def _serve(address, authkey, max_batch_size, max_wait_ms):
+    InferenceServer(address, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                    authkey=authkey).serve_forever()
+
+
+def _random_step(rng):
+    return {
+        "name": "Étape",
+        "cycle_time": round(rng.uniform(0.5, 10), 1),
+        "cost": rng.choice([200, 600, 1000, 1800]),
+        "value_added": rng.random() < 0.5
+    }
+
+
+def run_clients(make_predictor, clients, requests):
+    """Chaque client envoie `requests` prédictions d'une étape, séquentiellement"""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        predictor = make_predictor()
+        predictor.predict_wait_time(_random_step(rng))  # warm-up / connect
+        local = []
+        barrier.wait()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            predictor.predict_wait_time(_random_step(rng))
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2)
+    }
+
+
+def run_service(clients, requests, max_batch_size, max_wait_ms):
+    address = os.path.join(tempfile.mkdtemp(prefix="vsm_bench_"), "inference.sock")
+    authkey = secrets.token_hex(32).encode()  # throwaway key: the bench never touches the user's key file
+    proc = multiprocessing.Process(target=_serve, args=(address, authkey, max_batch_size, max_wait_ms),
+                                   daemon=True)
+    proc.start()
+    try:
+        deadline = time.time() + 60
+        while not os.path.exists(address):
+            if time.time() > deadline or not proc.is_alive():
+                raise RuntimeError("Le service d'inférence n'a pas démarré")
+            time.sleep(0.05)
+        client = InferenceClient(address, authkey=authkey, timeout=30.0)
+        return run_clients(lambda: client, clients, requests)
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="Appelants concurrents")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes par appelant")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="Fichier JSON de résultats (sinon stdout)")
+    args = parser.parse_args(argv)
+
+    ml = MLAnalyzer()
+    results = {
+        "config": vars(args),
+        "in_process": run_clients(lambda: ml, args.clients, args.requests),
+        "service_no_batching": run_service(args.clients, args.requests, 1, 0.0),
+        "service_batching": run_service(args.clients, args.requests, args.max_batch_size, args.max_wait_ms)
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
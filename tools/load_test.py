@@ -0,0 +1,333 @@
+# tools/load_test.py
+"""
+Test de charge de bout en bout de l'application Flask.
+
+Démarre app.py localement sur une base SQLite et un dossier de sortie temporaires
+(ou cible --url), rejoue un mélange de trafic /api/analyze, /api/analyze_step,
+/api/chat et /outputs (ou des requêtes enregistrées, --replay fichier.jsonl)
+à concurrence fixe ou à débit cible, puis écrit en JSON le débit, les latences
+p50/p90/p99 et le taux d'erreur par endpoint.
+
+    python tools/load_test.py --concurrency 16 --duration 30
+    python tools/load_test.py --rate 50 --duration 60 --mix analyze=1,analyze_step=6,chat=2,outputs=1
+    python tools/load_test.py --replay recorded.jsonl --output run_a.json
+
+Format --replay (une requête JSON par ligne):
+    {"method": "POST", "path": "/api/analyze_step", "body": {"name": "Soudure", "cycle_time": 4}}
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "analyze=2,analyze_step=5,chat=2,outputs=1"
+CHAT_MESSAGES = ["Montre-moi l'historique", "Quel est mon goulot ?", "Compare avec le passé",
+                 "Analyse des coûts", "C'est quoi le kanban ?", "Calcule le takt time"]
+SEED_OUTPUT = "vsm_loadtest_seed.json"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    # nearest-rank percentile
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("analyze", "analyze_step", "chat", "outputs"):
+            raise ValueError(f"Endpoint inconnu dans --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def load_replay(path):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            r = json.loads(line)
+            records.append({
+                "endpoint": r.get("endpoint") or r["path"].split("?")[0],
+                "method": r.get("method", "POST" if "body" in r else "GET").upper(),
+                "path": r["path"],
+                "body": r.get("body")
+            })
+    if not records:
+        raise ValueError(f"Aucune requête dans {path}")
+    return records
+
+
+def random_step(rng, name):
+    return {
+        "name": name,
+        "cycle_time": round(rng.uniform(0.5, 8), 1),
+        "cost": rng.choice([200, 500, 800, 1200, 1800]),
+        "value_added": rng.random() < 0.6
+    }
+
+
+class TrafficGenerator:
+    """Produit la prochaine requête: mélange pondéré ou rejeu séquentiel"""
+
+    def __init__(self, mix, steps_per_analysis, replay=None, seed=42):
+        self.mix = list(mix.items())
+        self.steps_per_analysis = steps_per_analysis
+        self.replay = replay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def next_request(self):
+        with self._lock:
+            if self.replay:
+                r = self.replay[self._next % len(self.replay)]
+                self._next += 1
+                return r
+            endpoint = self._rng.choices([m[0] for m in self.mix], weights=[m[1] for m in self.mix])[0]
+            rng = random.Random(self._rng.random())
+        if endpoint == "analyze":
+            steps = []
+            for i in range(self.steps_per_analysis):
+                s = random_step(rng, f"Step {i + 1}")
+                s["depends_on"] = [f"Step {i}"] if i else []
+                steps.append(s)
+            body = {"process_name": "Load test", "steps": steps}
+            return {"endpoint": endpoint, "method": "POST", "path": "/api/analyze", "body": body}
+        if endpoint == "analyze_step":
+            return {"endpoint": endpoint, "method": "POST", "path": "/api/analyze_step",
+                    "body": random_step(rng, "Étape")}
+        if endpoint == "chat":
+            return {"endpoint": endpoint, "method": "POST", "path": "/api/chat",
+                    "body": {"message": rng.choice(CHAT_MESSAGES)}}
+        return {"endpoint": endpoint, "method": "GET", "path": f"/outputs/{SEED_OUTPUT}", "body": None}
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint, latency, ok, status):
+        with self._lock:
+            s = self.samples.setdefault(endpoint, {"latencies": [], "errors": 0, "statuses": {}})
+            s["latencies"].append(latency)
+            s["statuses"][str(status)] = s["statuses"].get(str(status), 0) + 1
+            if not ok:
+                s["errors"] += 1
+
+    def report(self, elapsed):
+        def stats(latencies, errors, statuses=None):
+            n = len(latencies)
+            out = {
+                "requests": n,
+                "errors": errors,
+                "error_rate": round(errors / n, 4) if n else 0.0,
+                "throughput_rps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+                "latency_ms": {
+                    "mean": round(sum(latencies) / n * 1000, 2) if n else 0.0,
+                    "p50": round(percentile(latencies, 50) * 1000, 2),
+                    "p90": round(percentile(latencies, 90) * 1000, 2),
+                    "p99": round(percentile(latencies, 99) * 1000, 2),
+                    "max": round(max(latencies) * 1000, 2) if n else 0.0
+                }
+            }
+            if statuses is not None:
+                out["status_codes"] = statuses
+            return out
+
+        with self._lock:
+            endpoints = {k: stats(v["latencies"], v["errors"], v["statuses"]) for k, v in sorted(self.samples.items())}
+            all_lat = [l for v in self.samples.values() for l in v["latencies"]]
+            all_err = sum(v["errors"] for v in self.samples.values())
+        return {"elapsed_s": round(elapsed, 3), "total": stats(all_lat, all_err), "endpoints": endpoints}
+
+
+def send(base_url, req, timeout):
+    data = None
+    headers = {}
+    if req["body"] is not None:
+        data = json.dumps(req["body"]).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    http_req = urllib.request.Request(base_url + req["path"], data=data, headers=headers, method=req["method"])
+    try:
+        with urllib.request.urlopen(http_req, timeout=timeout) as resp:
+            body = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        return False, e.code
+    except (urllib.error.URLError, OSError):
+        return False, "connection_error"
+    ok = status < 400
+    # /api/chat reports failures in a 200 body
+    if ok and req["path"].startswith("/api/") and body[:1] == b"{":
+        try:
+            payload = json.loads(body)
+            ok = "error" not in payload and not str(payload.get("response", "")).startswith("❌ Erreur")
+        except ValueError:
+            ok = False
+    return ok, status
+
+
+def run_concurrency(base_url, generator, recorder, concurrency, duration, total, timeout):
+    """Boucle fermée: chaque worker enchaîne ses requêtes"""
+    deadline = time.perf_counter() + duration if duration else None
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            if deadline and time.perf_counter() >= deadline:
+                return
+            with lock:
+                if total and counter["n"] >= total:
+                    return
+                counter["n"] += 1
+            req = generator.next_request()
+            t0 = time.perf_counter()
+            ok, status = send(base_url, req, timeout)
+            recorder.add(req["endpoint"], time.perf_counter() - t0, ok, status)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_rate(base_url, generator, recorder, rate, concurrency, duration, total, timeout):
+    """Boucle ouverte: une requête toutes les 1/rate s; la latence inclut l'attente d'un worker"""
+    interval = 1.0 / rate
+    start = time.perf_counter()
+
+    def task(req, scheduled):
+        ok, status = send(base_url, req, timeout)
+        recorder.add(req["endpoint"], time.perf_counter() - scheduled, ok, status)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        i = 0
+        while True:
+            scheduled = start + i * interval
+            if duration and scheduled - start >= duration:
+                break
+            if total and i >= total:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(task, generator.next_request(), scheduled)
+            i += 1
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_app(workdir, port, startup_timeout=120):
+    """Lancer app.py sur une base et un dossier de sortie temporaires"""
+    out_dir = os.path.join(workdir, "vsm_output")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, SEED_OUTPUT), "w", encoding="utf-8") as f:
+        json.dump({"process": "Load test", "timeline": []}, f)
+    env = dict(os.environ)
+    env["VSM_DB_PATH"] = os.path.join(workdir, "vsm_data.db")
+    env["VSM_OUTPUT_FOLDER"] = out_dir
+    env["PYTHONWARNINGS"] = "ignore"
+    log = open(os.path.join(workdir, "app.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            log.close()
+            with open(log.name, encoding="utf-8", errors="replace") as f:
+                tail = f.read()[-2000:]
+            raise RuntimeError(f"L'application s'est arrêtée au démarrage:\n{tail}")
+        try:
+            with urllib.request.urlopen(base_url + "/", timeout=2):
+                return proc, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("L'application n'a pas démarré à temps")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Cibler un serveur existant au lieu de démarrer app.py")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workers concurrents")
+    parser.add_argument("--rate", type=float, help="Débit cible (req/s); sinon boucle fermée à --concurrency")
+    parser.add_argument("--duration", type=float, default=20.0, help="Durée (s), 0 = illimitée")
+    parser.add_argument("--requests", type=int, default=0, help="Nombre total de requêtes, 0 = illimité")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Poids par endpoint")
+    parser.add_argument("--steps", type=int, default=10, help="Étapes par requête /api/analyze")
+    parser.add_argument("--replay", help="Rejouer les requêtes d'un fichier JSONL au lieu du mélange")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de résultats (sinon stdout)")
+    args = parser.parse_args(argv)
+    if not args.duration and not args.requests:
+        parser.error("--duration ou --requests est requis")
+
+    generator = TrafficGenerator(parse_mix(args.mix), args.steps,
+                                 load_replay(args.replay) if args.replay else None, args.seed)
+    recorder = Recorder()
+
+    proc = workdir = None
+    base_url = args.url.rstrip("/") if args.url else None
+    try:
+        if base_url is None:
+            workdir = tempfile.mkdtemp(prefix="vsm_loadtest_")
+            proc, base_url = start_local_app(workdir, free_port())
+        start = time.perf_counter()
+        if args.rate:
+            run_rate(base_url, generator, recorder, args.rate, args.concurrency,
+                     args.duration, args.requests, args.timeout)
+        else:
+            run_concurrency(base_url, generator, recorder, args.concurrency,
+                            args.duration, args.requests, args.timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    report.update(recorder.report(elapsed))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()